@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+import asyncio
+import orjson
 import serial
 import serial.tools.list_ports
+import sys
 import threading
 import time
 import logging
-from typing import Optional, Dict, Any
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 app.add_middleware(
@@ -18,23 +25,49 @@ app.add_middleware(
 ser: Optional[serial.Serial] = None
 reader_thread: Optional[threading.Thread] = None
 reader_stop_event = threading.Event()
-telemetry_lock = threading.Lock()
-feedback_thread: Optional[threading.Thread] = None
-feedback_stop_event = threading.Event()
+feedback_task: Optional["asyncio.Task[None]"] = None
+event_loop: Optional[asyncio.AbstractEventLoop] = None
+# Set (then replaced) each time a snapshot is published, to wake /stream clients
+telemetry_event: Optional[asyncio.Event] = None
+stream_clients = 0
+# (time.monotonic() of last enumeration, device names) for /ports
+ports_cache: Tuple[float, List[str]] = (float("-inf"), [])
+
+
+@dataclass(frozen=True, slots=True)
+class Telemetry:
+    timestamp: int = 0
+    voltage: float = 0.0       # VOUT in volts
+    current: float = 0.0       # IOUT in amps
+    power: float = 0.0         # computed W
+    temperature: float = 25.0  # default if not provided
+    inputVoltage: float = 0.0  # VIN in volts when provided
+    mode: str = "standby"
+    warnings: List[str] = field(default_factory=list)
+
 
 # Track last parsed telemetry and simple state
-last_telemetry: Dict[str, Any] = {
-    "timestamp": 0,
-    "voltage": 0.0,      # VOUT in volts
-    "current": 0.0,      # IOUT in amps
-    "power": 0.0,        # computed W
-    "temperature": 25.0, # default if not provided
-    "inputVoltage": 0.0, # VIN in volts when provided
-    "mode": "standby",
-    "warnings": [],
-}
+last_telemetry = Telemetry()
 output_on = False
 
+# Fixed device commands, encoded once
+_CMD_F1 = b"F:1\n"
+_CMD_O = (b"O:0\n", b"O:1\n")
+
+# Telemetry field prefixes (upper-cased) and their slot in _scan_fields' result.
+# IOUT from device is treated as mA by convention from desktop app.
+_FIELD_PREFIXES = ((b"VOUT:", 0), (b"IOUT:", 1), (b"VIN:", 2), (b"TEMP:", 3))
+
+_RX_BUF_MAX = 4096  # bytes of an unterminated line kept before giving up on it
+_PORTS_TTL_S = 0.5  # how long a /ports enumeration is reused
+_STREAM_KEEPALIVE_S = 15.0  # idle time before /stream sends a keepalive comment
+_STREAM_LIFETIME_S = 30.0  # /stream closes after this long; clients reconnect
+
+# Thermal estimate used when the device doesn't report TEMP
+_AMBIENT_C = 25.0
+_GAIN_C_PER_W = 2.0  # 2 C per Watt as heuristic
+_ALPHA = 0.2  # smoothing factor
+
 
 def setup_logging() -> None:
     # Configure logging once
@@ -44,9 +77,48 @@ def setup_logging() -> None:
     )
 
 
-def parse_and_update_telemetry(line: str) -> None:
+def _enable_low_latency(port: serial.Serial) -> None:
+    """Best effort, Linux only: stop the USB-serial driver from batching RX bytes (FTDI's 16 ms latency timer)."""
+    # pyserial defines set_low_latency_mode on every POSIX platform but only implements it on
+    # Linux; elsewhere it raises NotImplementedError. Windows has no equivalent through pyserial.
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        # Sets ASYNC_LOW_LATENCY via TIOCGSERIAL/TIOCSSERIAL
+        port.set_low_latency_mode(True)
+    except (OSError, ValueError, NotImplementedError) as exc:
+        # CDC-ACM and some adapters don't support it; the port still works, just with driver batching
+        logger.info("Low-latency serial mode unavailable: %s", exc)
+
+
+def _scan_fields(line: bytes) -> Tuple[Optional[float], ...]:
+    """Scan a telemetry line once, returning (VOUT, IOUT mA, VIN, TEMP) with None for absent fields."""
+    fields: List[Optional[float]] = [None, None, None, None]
+    buf = line.upper()
+    n = len(buf)
+    i = 0
+    while i < n:
+        end = buf.find(b",", i)
+        if end < 0:
+            end = n
+        while i < end and buf[i] in b" \t\r\v\f":  # skip whitespace after a comma
+            i += 1
+        for prefix, slot in _FIELD_PREFIXES:
+            if buf.startswith(prefix, i, end):
+                token = buf[i + len(prefix):end]
+                try:
+                    fields[slot] = float(token)
+                except ValueError:
+                    # Stray non-ASCII bytes (line noise): drop them rather than the whole line
+                    fields[slot] = float(token.decode("ascii", "ignore"))
+                break
+        i = end + 1
+    return tuple(fields)
+
+
+def parse_and_update_telemetry(raw: bytes) -> None:
     global last_telemetry
-    line = line.strip()
+    line = raw.strip()
     if not line:
         return
 
@@ -55,119 +127,183 @@ def parse_and_update_telemetry(line: str) -> None:
     #   VOUT:4.98
     #   IOUT:523.1  (mA)
     #   VIN:12.10
+    # Fields are parsed straight from the raw bytes; float() accepts ASCII bytes,
+    # so the common case never goes through the UTF-8 codec.
     try:
-        parsed: Dict[str, float] = {}
-        if "," in line:
-            parts = [p.strip() for p in line.split(",") if p.strip()]
-        else:
-            parts = [line]
-
-        for part in parts:
-            if part.upper().startswith("VOUT:"):
-                v_str = part.split(":", 1)[1].strip()
-                parsed["VOUT"] = float(v_str)
-            elif part.upper().startswith("IOUT:"):
-                i_str = part.split(":", 1)[1].strip()
-                # Treat IOUT from device as mA by convention from desktop app
-                parsed["IOUT_mA"] = float(i_str)
-            elif part.upper().startswith("VIN:"):
-                vin_str = part.split(":", 1)[1].strip()
-                parsed["VIN"] = float(vin_str)
-            elif part.upper().startswith("TEMP:"):
-                t_str = part.split(":", 1)[1].strip()
-                parsed["TEMP"] = float(t_str)
-
-        with telemetry_lock:
-            # Start with current values, then update fields from parsed
-            voltage_v = parsed.get("VOUT", float(last_telemetry.get("voltage", 0.0)))
-            current_a = last_telemetry.get("current", 0.0)
-            if "IOUT_mA" in parsed:
-                current_a = float(parsed["IOUT_mA"]) / 1000.0
-            input_voltage_v = float(parsed.get("VIN", float(last_telemetry.get("inputVoltage", 0.0))))
+        vout, iout_ma, vin, temp = _scan_fields(line)
+
+        # Start with current values, then update fields from parsed
+        prev = last_telemetry
+        voltage_v = prev.voltage if vout is None else vout
+        current_a = prev.current if iout_ma is None else iout_ma / 1000.0
+        input_voltage_v = prev.inputVoltage if vin is None else vin
 
+        if vout is None and iout_ma is None and temp is None:
+            # Nothing feeding power or temperature changed (e.g. VIN-only line); reuse them
+            power_w = prev.power
+            temperature_c = prev.temperature
+        else:
+            power_w = voltage_v * current_a
             # Temperature handling: if TEMP not provided, estimate from power with smoothing
-            if "TEMP" in parsed:
-                temperature_c = float(parsed["TEMP"])  # direct from device
+            if temp is not None:
+                temperature_c = temp  # direct from device
             else:
-                prev_temp = float(last_telemetry.get("temperature", 25.0))
-                power_w = float(voltage_v) * float(current_a)
-                # Simple thermal model: ambient 25C + gain * power, low-pass filtered
-                target_temp = 25.0 + 2.0 * power_w  # 2 C per Watt as heuristic
+                prev_temp = prev.temperature
+                # Simple thermal model: ambient + gain * power, low-pass filtered
+                target_temp = _AMBIENT_C + _GAIN_C_PER_W * power_w
                 # Smooth approach to avoid jumps
-                alpha = 0.2  # smoothing factor
-                temperature_c = max(0.0, min(90.0, prev_temp + alpha * (target_temp - prev_temp)))
-
-            last_telemetry.update(
-                {
-                    "timestamp": int(time.time() * 1000),
-                    "voltage": float(voltage_v),
-                    "current": float(current_a),
-                    "power": float(voltage_v) * float(current_a),
-                    "temperature": float(temperature_c),
-                    "inputVoltage": float(input_voltage_v),
-                    "mode": "load" if output_on else "standby",
-                    # We keep warnings empty by default
-                    "warnings": last_telemetry.get("warnings", []),
-                }
-            )
-
-        logging.info(f"Parsed telemetry: {last_telemetry}")
+                temperature_c = max(0.0, min(90.0, prev_temp + _ALPHA * (target_temp - prev_temp)))
+
+        new = Telemetry(
+            timestamp=time.time_ns() // 1_000_000,
+            voltage=voltage_v,
+            current=current_a,
+            power=power_w,
+            temperature=temperature_c,
+            inputVoltage=input_voltage_v,
+            mode="load" if output_on else "standby",
+            # We keep warnings empty by default
+            warnings=prev.warnings,
+        )
+        # Publish with a single reference store; readers never see a half-updated snapshot
+        last_telemetry = new
+        if stream_clients and event_loop:
+            event_loop.call_soon_threadsafe(_wake_stream_clients)
+
+        logger.info("Parsed telemetry: %s", new)
     except Exception as exc:
-        logging.exception(f"Failed to parse line '{line}': {exc}")
+        logger.exception("Failed to parse line %r: %s", line, exc)
+
+
+def _wake_stream_clients() -> None:
+    # Runs on the event loop; swap in a fresh event so waiters only see new snapshots
+    global telemetry_event
+    event, telemetry_event = telemetry_event, asyncio.Event()
+    event.set()
 
 
 def reader_loop() -> None:
-    logging.info("Serial reader thread started")
+    logger.info("Serial reader thread started")
+    rx_buf = b""
+    rx_port: Optional[serial.Serial] = None  # port the bytes in rx_buf came from
+    rx_overflowed = False  # warn once per port, not on every overflow
     while not reader_stop_event.is_set():
         try:
-            if ser and ser.is_open and getattr(ser, "in_waiting", 0) > 0:
-                raw = ser.readline()
-                try:
-                    line = raw.decode("utf-8", errors="ignore").strip()
-                except Exception:
-                    line = str(raw)
-                if line:
-                    logging.info(f"[SERIAL] {line}")
+            # Look the global up once: the guard and the read then hit the same object
+            # even if /connect swaps the port in between
+            port = ser
+            if port and port.is_open:
+                if port is not rx_port:
+                    # New connection: don't glue the old port's partial line onto its first line
+                    rx_buf, rx_port, rx_overflowed = b"", port, False
+                # Drain everything already buffered in one read; when idle this blocks
+                # for at most the port timeout waiting on the next byte
+                chunk = port.read(port.in_waiting or 1)
+                if b"\n" not in chunk:
+                    rx_buf += chunk
+                    if len(rx_buf) > _RX_BUF_MAX:
+                        # No line ending in sight (wrong baud rate, garbage on the wire)
+                        if not rx_overflowed:
+                            logger.warning("Dropping serial data with no newline after %d bytes", len(rx_buf))
+                            rx_overflowed = True
+                        rx_buf = b""
+                    continue
+                # Keep any trailing partial line for the next read
+                *lines, rx_buf = (rx_buf + chunk).split(b"\n")
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    # Only decode for the log when someone will see it
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("[SERIAL] %s", line.decode("utf-8", errors="ignore"))
                     parse_and_update_telemetry(line)
             else:
-                time.sleep(0.05)
+                rx_buf = b""
+                # Idle until a port shows up; wakes immediately on /disconnect or shutdown
+                if reader_stop_event.wait(0.05):
+                    break
         except Exception as exc:
-            logging.exception(f"Reader loop error: {exc}")
-            time.sleep(0.2)
-    logging.info("Serial reader thread stopped")
+            if reader_stop_event.is_set():
+                # Port closed while we were being stopped; not an error
+                break
+            logger.exception("Reader loop error: %s", exc)
+            if reader_stop_event.wait(0.2):
+                break
+    logger.info("Serial reader thread stopped")
 
 
-def feedback_loop(period_ms: int = 500) -> None:
-    logging.info("Feedback pinger thread started")
-    next_ts = time.time() * 1000.0
-    while not feedback_stop_event.is_set():
-        try:
-            if ser and ser.is_open:
-                cmd = "F:1\n"
-                ser.write(cmd.encode())
-                logging.debug("[PING] F:1")
-            # sleep until next period
-            now_ms = time.time() * 1000.0
-            next_ts += period_ms
-            sleep_ms = max(0.0, next_ts - now_ms)
-            time.sleep(sleep_ms / 1000.0)
-        except Exception as exc:
-            logging.exception(f"Feedback loop error: {exc}")
-            time.sleep(0.5)
-    logging.info("Feedback pinger thread stopped")
+async def feedback_loop(period_ms: int = 500) -> None:
+    logger.info("Feedback pinger task started")
+    loop = asyncio.get_running_loop()
+    period_s = period_ms / 1000.0
+    # Schedule on the loop's monotonic clock so NTP steps and sleep/wake don't skew pings
+    next_ts = loop.time()
+    try:
+        while True:
+            try:
+                if ser and ser.is_open:
+                    # Write off-loop so a stalled USB endpoint can't block request handling
+                    await loop.run_in_executor(None, ser.write, _CMD_F1)
+                    logger.debug("[PING] F:1")
+            except Exception as exc:
+                logger.exception("Feedback loop error: %s", exc)
+            # sleep until next period; don't burst to catch up after a stall
+            now = loop.time()
+            next_ts = max(next_ts + period_s, now)
+            await asyncio.sleep(next_ts - now)
+    finally:
+        logger.info("Feedback pinger task stopped")
+
+
+async def _stop_reader(timeout: float = 1.0) -> bool:
+    """Signal the reader thread and wait for it off the event loop; False if it is still running."""
+    if reader_thread is None or not reader_thread.is_alive():
+        return True
+    reader_stop_event.set()
+    await asyncio.to_thread(reader_thread.join, timeout)
+    return not reader_thread.is_alive()
+
+
+@app.on_event("startup")
+async def startup_event():
+    global feedback_task, event_loop, telemetry_event
+    setup_logging()
+    event_loop = asyncio.get_running_loop()
+    telemetry_event = asyncio.Event()
+    feedback_task = asyncio.create_task(feedback_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    reader_stop_event.set()
+    if feedback_task:
+        feedback_task.cancel()
 
 @app.get("/ports")
 def list_ports():
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports]
+    global ports_cache
+    # Enumeration walks sysfs/the registry; serve repeated polls from a short-lived cache
+    now = time.monotonic()
+    ts, devices = ports_cache
+    if now - ts < _PORTS_TTL_S:
+        return devices
+    devices = [port.device for port in serial.tools.list_ports.comports()]
+    ports_cache = (now, devices)
+    return devices
 
 @app.post("/connect")
 async def connect_port(request: Request):
     data = await request.json()
     port = data.get("port")
-    global ser, reader_thread, feedback_thread, output_on
+    global ser, reader_thread, output_on, last_telemetry, ports_cache
+    # Force a fresh enumeration on the next /ports after a connect attempt
+    ports_cache = (float("-inf"), [])
     try:
-        setup_logging()
+        # Stop the reader before touching the port or the snapshot, so a line still being
+        # parsed from the old port can't publish over the reset below
+        if not await _stop_reader():
+            return {"status": "error", "message": "Previous serial reader did not stop"}
         # Close any existing port
         if ser and ser.is_open:
             try:
@@ -175,35 +311,23 @@ async def connect_port(request: Request):
             except Exception:
                 pass
         # Reset state
-        with telemetry_lock:
-            last_telemetry.update({
-                "timestamp": int(time.time() * 1000),
-                "voltage": 0.0,
-                "current": 0.0,
-                "power": 0.0,
-                "temperature": 25.0,
-                "mode": "standby",
-                "warnings": [],
-            })
+        last_telemetry = Telemetry(
+            timestamp=time.time_ns() // 1_000_000,
+            inputVoltage=last_telemetry.inputVoltage,
+        )
         output_on = False
 
-        ser = serial.Serial(port, 115200, timeout=1)
+        # Short timeout so reads hand back data as soon as it arrives
+        ser = serial.Serial(port, 115200, timeout=0.01)
+        _enable_low_latency(ser)
 
-        # Start reader thread
-        if reader_thread is None or not reader_thread.is_alive():
-            reader_stop_event.clear()
-            reader_t = threading.Thread(target=reader_loop, name="serial-reader", daemon=True)
-            reader_t.start()
-            reader_thread = reader_t
+        # Start a fresh reader thread (any previous one has exited above)
+        reader_stop_event.clear()
+        reader_t = threading.Thread(target=reader_loop, name="serial-reader", daemon=True)
+        reader_t.start()
+        reader_thread = reader_t
 
-        # Start feedback pinger thread
-        if feedback_thread is None or not feedback_thread.is_alive():
-            feedback_stop_event.clear()
-            fb_t = threading.Thread(target=feedback_loop, name="feedback-pinger", daemon=True)
-            fb_t.start()
-            feedback_thread = fb_t
-
-        logging.info(f"Connected to {port}")
+        logger.info("Connected to %s", port)
         return {"status": "connected", "port": port}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -213,11 +337,12 @@ async def connect_port(request: Request):
 async def disconnect_port():
     global ser
     try:
-        reader_stop_event.set()
-        feedback_stop_event.set()
+        # Let the reader leave its blocking read before the port is closed under it
+        if not await _stop_reader():
+            logger.warning("Serial reader did not stop before disconnect")
         if ser and ser.is_open:
             ser.close()
-        logging.info("Serial disconnected")
+        logger.info("Serial disconnected")
         return {"status": "disconnected"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -236,14 +361,18 @@ async def set_values(request: Request):
             current_mA = None
 
     if ser and ser.is_open:
+        # Send both setpoints in one write so they reach the device together
+        buf = bytearray()
         if voltage is not None:
             cmd_v = f"V:{float(voltage):.2f}\n"
-            ser.write(cmd_v.encode())
-            logging.info(f"[SEND] {cmd_v.strip()}")
+            buf += cmd_v.encode()
+            logger.info("[SEND] %s", cmd_v.strip())
         if current_mA is not None:
             cmd_i = f"I:{int(current_mA)}\n"
-            ser.write(cmd_i.encode())
-            logging.info(f"[SEND] {cmd_i.strip()}")
+            buf += cmd_i.encode()
+            logger.info("[SEND] %s", cmd_i.strip())
+        if buf:
+            ser.write(bytes(buf))
         return {"status": "sent"}
     return {"status": "error", "message": "Serial not connected"}
 
@@ -254,34 +383,64 @@ async def toggle_output(request: Request):
     global output_on
     if ser and ser.is_open:
         output_on = bool(on)
-        cmd = f"O:{1 if output_on else 0}\n"
-        ser.write(cmd.encode())
-        logging.info(f"[SEND] {cmd.strip()}")
+        cmd = _CMD_O[1 if output_on else 0]
+        ser.write(cmd)
+        logger.info("[SEND] O:%d", 1 if output_on else 0)
         return {"status": "sent", "on": output_on}
     return {"status": "error", "message": "Serial not connected"}
 
 @app.post("/feedback")
 async def send_feedback():
     if ser and ser.is_open:
-        cmd = "F:1\n"
-        ser.write(cmd.encode())
-        logging.info(f"[SEND] {cmd.strip()}")
+        ser.write(_CMD_F1)
+        logger.info("[SEND] F:1")
         return {"status": "sent"}
     return {"status": "error", "message": "Serial not connected"}
 
+def _current_snapshot() -> Telemetry:
+    # Snapshots are replaced, never mutated, so no lock is needed to read one
+    snapshot = last_telemetry
+    if snapshot.timestamp == 0:
+        # No data yet; return zeros to keep frontend happy
+        snapshot = Telemetry(timestamp=time.time_ns() // 1_000_000)
+    return snapshot
+
+
 @app.get("/read")
 def read_serial():
     """Return the most recent parsed telemetry as JSON that the frontend expects."""
-    with telemetry_lock:
-        if last_telemetry.get("timestamp", 0) == 0:
-            # No data yet; return zeros to keep frontend happy
-            return {
-                "timestamp": int(time.time() * 1000),
-                "voltage": 0.0,
-                "current": 0.0,
-                "power": 0.0,
-                "temperature": 25.0,
-                "mode": "standby",
-                "warnings": [],
-            }
-        return last_telemetry
\ No newline at end of file
+    snapshot = _current_snapshot()
+    # orjson serializes the dataclass natively, skipping FastAPI's jsonable_encoder pass
+    return Response(orjson.dumps(snapshot), media_type="application/json")
+
+
+@app.get("/stream")
+async def stream_telemetry():
+    """Push each newly parsed telemetry snapshot as a server-sent event."""
+    async def events():
+        global stream_clients
+        loop = asyncio.get_running_loop()
+        # uvicorn waits for open responses before shutting down (or reloading), so a stream
+        # never ends on its own; cap its lifetime and let EventSource reconnect instead
+        deadline = loop.time() + _STREAM_LIFETIME_S
+        stream_clients += 1
+        try:
+            while loop.time() < deadline:
+                # Take the event before reading the snapshot, so anything published from
+                # here on (even while the yield is being sent) wakes us again
+                event = telemetry_event
+                # Bursts coalesce: a slow client just gets the newest snapshot
+                yield b"data: " + orjson.dumps(_current_snapshot()) + b"\n\n"
+                while not event.is_set():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return
+                    try:
+                        await asyncio.wait_for(event.wait(), min(_STREAM_KEEPALIVE_S, remaining))
+                    except asyncio.TimeoutError:
+                        # SSE comment; the write fails if the client has gone, ending the stream
+                        yield b": keepalive\n\n"
+        finally:
+            stream_clients -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")